@@ -20,8 +20,17 @@ price_slots = {
 }
 
 
-def get_price_slots_scores(period):
-    return sorted(price_slots[period].keys(), key=lambda x: price_slots[period][x], reverse=True)
+def get_price_slots_scores(period, tariff=None):
+    """
+    :param period: seasonal period (e.g. 'warm', 'cold')
+    :param tariff: optional prices per time slot, replacing the period's price slots
+    :return: score of each time slot: 0 for the most expensive price, 1 for the next one and so on
+             (slots with the same price get the same score)
+    """
+    if tariff is None:
+        tariff = price_slots[period]
+    prices = sorted(set(tariff.values()), reverse=True)
+    return {slot: prices.index(price) for slot, price in tariff.items()}
 
 
 def get_price_slot(dayhour, weekday):
@@ -0,0 +1,155 @@
+import numpy as np
+from pv_generation import pv_profiles
+from scheduling import (generate_scheduling, Hyperparameters, build_hp_factors_batch, compute_pv_factors_batch,
+                        compute_price_scores_batch, generate_scheduling_batch)
+from simulation import add_ev_constraints, draw_environment, simulation, simulation_batch, grid_search_params
+from ev_requirements import ev_requirements, DEFAULT_ENERGY
+from constraints_loader import load_constraints
+from grid_aggregation import build_households, expected_hourly_prices
+from results import hourly_to_array, array_to_hourly
+from random_streams import make_rng, scenario_stream
+
+# Largest absolute difference (kWh or €) accepted between the vectorized and the scalar results
+ABSOLUTE_TOLERANCE = 1e-9
+
+
+def check_scheduling_batch(households, weekday, period, coarse=False, max_passes=None):
+    """
+    Check that generate_scheduling_batch gives the same scheduling and error bounds as generate_scheduling
+    called for each household.
+
+    Returns:
+        The largest difference found.
+    """
+    hourly_prices = expected_hourly_prices(weekday, period)
+    pv_profile = hourly_to_array(pv_profiles[period])
+    batch_scheduling, batch_bounds = generate_scheduling_batch(
+        tot_energy=households['tot_energy'],
+        constraints_min=households['constraints_min'],
+        constraints_max=households['constraints_max'],
+        price_scores=compute_price_scores_batch(hourly_prices),
+        pv_factors=compute_pv_factors_batch(pv_profile),
+        hp_factors=build_hp_factors_batch(households['hyperparameters']),
+        max_kw=households['max_kw'],
+        max_passes=max_passes,
+        coarse=coarse,
+        return_error_bounds=True
+    )
+
+    max_difference = 0
+    for index in range(len(households['tot_energy'])):
+        scheduling, error_bounds = generate_scheduling(
+            weekday=weekday,
+            period=period,
+            tot_energy=households['tot_energy'][index],
+            constraints_min=array_to_hourly(households['constraints_min']),
+            constraints_max=array_to_hourly(households['constraints_max']),
+            hyperparameters=Hyperparameters(*households['hyperparameters'][index]),
+            max_kw=households['max_kw'],
+            hourly_prices=array_to_hourly(hourly_prices),
+            max_passes=max_passes,
+            coarse=coarse,
+            return_error_bounds=True
+        )
+        max_difference = max(max_difference, np.abs(hourly_to_array(scheduling) - batch_scheduling[index]).max())
+        for name, value in error_bounds.items():
+            max_difference = max(max_difference, abs(value - batch_bounds[name][index]))
+
+    assert max_difference <= ABSOLUTE_TOLERANCE, f"Batch scheduling differs by {max_difference}"
+    return max_difference
+
+
+def check_simulation_batch(households, weekday, period, seed=0):
+    """
+    Check that simulation_batch gives the same expenses, energy sold and hourly costs as simulation
+    called for each household, on a randomly drawn day.
+
+    Returns:
+        The largest difference found.
+    """
+    pv_profile, hourly_prices = draw_environment(weekday, period, rng=make_rng(seed))
+    scheduling = households['constraints_min'] + (households['constraints_max'] - households['constraints_min']) * 0.5
+    scheduling = np.broadcast_to(scheduling, (len(households['tot_energy']), 24))
+    expenses, energy_sold, hourly_costs = simulation_batch(
+        scheduling, households['pv_panels'][:, np.newaxis] * hourly_to_array(pv_profile), hourly_to_array(hourly_prices)
+    )
+
+    max_difference = 0
+    for index in range(len(scheduling)):
+        scalar_expenses, scalar_energy_sold, scalar_hourly_costs = simulation(
+            weekday=weekday,
+            scheduling=array_to_hourly(scheduling[index]),
+            pv_panels_count=households['pv_panels'][index],
+            period=period,
+            pv_profile=pv_profile,
+            hourly_prices=hourly_prices
+        )
+        max_difference = max(
+            max_difference,
+            abs(scalar_expenses - expenses[index]),
+            abs(scalar_energy_sold - energy_sold[index]),
+            np.abs(hourly_to_array(scalar_hourly_costs) - hourly_costs[index]).max()
+        )
+
+    assert max_difference <= ABSOLUTE_TOLERANCE, f"Batch simulation differs by {max_difference}"
+    return max_difference
+
+
+def check_screening(weekday, period, day_type, pv_panels_count=5, max_kw=6, hyperparameters_test_count=5, seed=0):
+    """
+    Check that grid_search_params returns the same hyperparameters with and without screening.
+
+    Returns:
+        The best hyperparameters, as a tuple.
+    """
+    ev_config = ev_requirements[day_type]
+    constraints_min, constraints_max = load_constraints(day_type=day_type, max_kw=max_kw)
+    constraints_min, constraints_max = add_ev_constraints(
+        constraints_min, constraints_max, ev_config['charging_hours'], ev_config['total_energy'],
+        ev_config['power_limit'], max_kw=max_kw
+    )
+    search_args = {
+        'weekday': weekday,
+        'period': period,
+        'tot_energy': DEFAULT_ENERGY[day_type],
+        'pv_panels_count': pv_panels_count,
+        'constraints_min': constraints_min,
+        'constraints_max': constraints_max,
+        'hyperparameters_range': [0.1, 10],
+        'hyperparameters_test_count': hyperparameters_test_count,
+        'max_kw': max_kw,
+        'environment': draw_environment(weekday, period,
+                                        rng=make_rng(seed, scenario=scenario_stream(period, period, weekday))),
+    }
+
+    exhaustive = grid_search_params(**search_args)
+    screened = grid_search_params(screening=True, **search_args)
+    best = tuple(float(getattr(exhaustive, name)) for name in Hyperparameters.__slots__)
+    assert tuple(getattr(screened, name) for name in Hyperparameters.__slots__) == best, \
+        "Screening changed the best hyperparameters"
+    return best
+
+
+if __name__ == '__main__':
+    scenarios = [
+        {"season": "warm", "day_type": "workdays", "weekday": 4},
+        {"season": "cold", "day_type": "weekend", "weekday": 6},
+    ]
+
+    for scenario in scenarios:
+        households = build_households(200, scenario['day_type'])
+        name = f"{scenario['day_type'].capitalize()} ({scenario['season'].capitalize()})"
+
+        for coarse, max_passes in ((False, None), (False, 2), (True, None)):
+            difference = check_scheduling_batch(households, scenario['weekday'], scenario['season'],
+                                                coarse=coarse, max_passes=max_passes)
+            print(f"{name}: batch scheduling (coarse={coarse}, max_passes={max_passes}) "
+                  f"matches within {difference:.1e}")
+
+        difference = check_simulation_batch(households, scenario['weekday'], scenario['season'])
+        print(f"{name}: batch simulation matches within {difference:.1e}")
+
+        for pv_panels_count in (3, 5):
+            best = check_screening(scenario['weekday'], scenario['season'], scenario['day_type'],
+                                   pv_panels_count=pv_panels_count)
+            print(f"{name}: screening with {pv_panels_count} panels finds the exhaustive best {best}")
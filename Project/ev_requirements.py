@@ -11,3 +11,9 @@ ev_requirements = {
         "power_limit": 3.6,  # Maximum charging power (kW)
     },
 }
+
+# Default total energy to schedule per day (kWh), including the EV requirements
+DEFAULT_ENERGY = {
+    "workdays": 35,
+    "weekend": 40,
+}
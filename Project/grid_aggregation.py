@@ -0,0 +1,225 @@
+import time
+import numpy as np
+import matplotlib.pyplot as plt
+from electricity_prices import price_slots, get_price_slot
+from pv_generation import pv_profiles
+from ev_requirements import ev_requirements, DEFAULT_ENERGY
+from constraints_loader import load_constraints
+from scheduling import (build_hp_factors_batch, compute_pv_factors_batch, compute_price_scores_batch,
+                        generate_scheduling_batch)
+from simulation import add_ev_constraints, simulation_batch, output_path
+from results import hourly_to_array
+from random_streams import household_rngs
+
+
+def build_households(count, day_type, max_kw=6, energy_spread=0.15, panels_range=(0, 8),
+                     hyperparameters_range=(0.1, 10), seed=0, scenario=0, day=0, first_household=0):
+    """
+    Generate a neighbourhood of households with different energy needs, PV panels and preferences.
+
+    Parameters:
+        count: Number of households.
+        day_type: Day type of the constraints and EV requirements (e.g. 'workdays').
+        max_kw: Maximum energy allowed per hour.
+        energy_spread: Relative spread of the total daily energy around the day type's default.
+        panels_range: Range (inclusive) of the number of PV panels.
+        hyperparameters_range: Range of the hyperparameters of each household.
+        seed: Root random seed.
+        scenario: Index of the scenario, selecting the random streams.
+        day: Index of the day, selecting the random streams.
+        first_household: Index of the first household, to build a large neighbourhood in chunks.
+
+    Each household draws from its own random stream, so a household is the same whether the
+    neighbourhood is built at once or in chunks.
+
+    Returns:
+        Dictionary with the households' 'tot_energy', 'pv_panels', 'hyperparameters' (one row per household)
+        and the shared 'constraints_min', 'constraints_max' and 'max_kw'.
+    """
+    # Six uniform draws per household: total energy, panels and the four hyperparameters
+    rngs = household_rngs(seed, range(first_household, first_household + count), scenario=scenario, day=day)
+    draws = np.array([rng.random(6) for rng in rngs]).reshape(count, 6)
+
+    ev_config = ev_requirements[day_type]
+    constraints_min, constraints_max = load_constraints(day_type=day_type, max_kw=max_kw)
+    constraints_min, constraints_max = add_ev_constraints(
+        constraints_min, constraints_max, ev_config['charging_hours'], ev_config['total_energy'],
+        ev_config['power_limit'], max_kw=max_kw
+    )
+    constraints_min = hourly_to_array(constraints_min)
+    constraints_max = hourly_to_array(constraints_max)
+
+    tot_energy = DEFAULT_ENERGY[day_type] * (1 - energy_spread + 2 * energy_spread * draws[:, 0])
+    tot_energy = np.clip(tot_energy, constraints_min.sum(), constraints_max.sum())
+    pv_panels = panels_range[0] + np.floor(draws[:, 1] * (panels_range[1] - panels_range[0] + 1)).astype(int)
+    hp_low, hp_high = hyperparameters_range
+
+    return {
+        'tot_energy': tot_energy,
+        'pv_panels': pv_panels,
+        'hyperparameters': hp_low + (hp_high - hp_low) * draws[:, 2:],
+        'constraints_min': constraints_min,
+        'constraints_max': constraints_max,
+        'max_kw': max_kw,
+    }
+
+
+def expected_hourly_prices(weekday, period):
+    """
+    Return the price of each hour of the day according to the period's price slots.
+    """
+    return np.array([price_slots[period][get_price_slot(hour, weekday)] for hour in range(24)])
+
+
+def update_prices(base_prices, feeder_load, elasticity, feeder_capacity=None, congestion_penalty=1.0):
+    """
+    Compute hourly prices as a function of the aggregate demand of the feeder.
+
+    Prices rise (or fall) with the load relative to the feeder's average load, and an additional
+    penalty applies to hours in which the load exceeds the feeder capacity.
+
+    Parameters:
+        base_prices: Hourly prices at average load.
+        feeder_load: Aggregate energy scheduled per hour.
+        elasticity: Relative price change per relative change of the load.
+        feeder_capacity: Optional maximum energy per hour the feeder should carry.
+        congestion_penalty: Relative price increase per relative excess over the capacity.
+
+    Returns:
+        Hourly prices.
+    """
+    price_factors = 1 + elasticity * (feeder_load / feeder_load.mean() - 1)
+    if feeder_capacity is not None:
+        price_factors += congestion_penalty * np.maximum(0, feeder_load / feeder_capacity - 1)
+    return base_prices * np.maximum(price_factors, 0)
+
+
+def schedule_households(households, hourly_prices, pv_factors):
+    """
+    Schedule every household at once for the given hourly prices.
+    """
+    return generate_scheduling_batch(
+        tot_energy=households['tot_energy'],
+        constraints_min=households['constraints_min'],
+        constraints_max=households['constraints_max'],
+        price_scores=compute_price_scores_batch(hourly_prices),
+        pv_factors=pv_factors,
+        hp_factors=build_hp_factors_batch(households['hyperparameters']),
+        max_kw=households['max_kw']
+    )
+
+
+def run_price_feedback(households, weekday, period, elasticity=0.5, feeder_capacity=None, congestion_penalty=1.0,
+                       damping=0.5, tol=1e-4, max_iterations=100):
+    """
+    Iterate between household scheduling and demand-dependent prices until prices converge.
+
+    At each iteration every household is scheduled for the current prices, the schedules are summed into
+    the feeder load and new prices are computed from it. Prices move towards the new ones by a damping
+    factor, to avoid oscillating between everyone piling into one cheap hour and then another.
+
+    Parameters:
+        households: Households, as returned by build_households.
+        weekday: Day of the week.
+        period: Seasonal period.
+        elasticity: Relative price change per relative change of the load.
+        feeder_capacity: Optional maximum energy per hour the feeder should carry.
+        congestion_penalty: Relative price increase per relative excess over the capacity.
+        damping: Fraction of the price update applied at each iteration, in (0, 1].
+        tol: Convergence threshold on the largest relative price change.
+        max_iterations: Maximum number of iterations.
+
+    Returns:
+        Dictionary with the final 'hourly_prices', the 'scheduling' of each household, 'feeder_load'
+        and 'expenses' of each household for those prices, 'initial_feeder_load' (at the base prices), 'iterations',
+        'converged' and the 'price_changes' of every iteration.
+    """
+    base_prices = expected_hourly_prices(weekday, period)
+    pv_profile = hourly_to_array(pv_profiles[period])
+    pv_factors = compute_pv_factors_batch(pv_profile)
+
+    hourly_prices = base_prices
+    initial_feeder_load = None
+    price_changes = []
+    converged = False
+
+    for iteration in range(1, max_iterations + 1):
+        scheduling = schedule_households(households, hourly_prices, pv_factors)
+        feeder_load = scheduling.sum(axis=0)
+        if initial_feeder_load is None:
+            initial_feeder_load = feeder_load
+
+        target_prices = update_prices(base_prices, feeder_load, elasticity, feeder_capacity, congestion_penalty)
+        price_change = np.max(np.abs(target_prices - hourly_prices) / base_prices)
+        price_changes.append(price_change)
+        if price_change < tol:
+            converged = True
+            break
+
+        hourly_prices = hourly_prices + damping * (target_prices - hourly_prices)
+
+    # Without convergence the prices were updated after the last scheduling, so households are
+    # scheduled once more for the returned prices
+    if not converged:
+        scheduling = schedule_households(households, hourly_prices, pv_factors)
+        feeder_load = scheduling.sum(axis=0)
+
+    solar_profile = households['pv_panels'][:, np.newaxis] * pv_profile
+    expenses, _, _ = simulation_batch(scheduling, solar_profile, hourly_prices)
+
+    return {
+        'scheduling': scheduling,
+        'feeder_load': feeder_load,
+        'hourly_prices': hourly_prices,
+        'expenses': expenses,
+        'initial_feeder_load': initial_feeder_load,
+        'iterations': iteration,
+        'converged': converged,
+        'price_changes': price_changes,
+    }
+
+
+def plot_feeder_load(result, base_prices, scenario):
+    """
+    Plot the feeder load and prices before and after the price feedback.
+    """
+    hours = np.arange(24)
+    fig, ax = plt.subplots(2, 1, figsize=(14, 9), sharex=True)
+
+    ax[0].step(hours, result['initial_feeder_load'], where='mid', label='Base prices', color='skyblue')
+    ax[0].step(hours, result['feeder_load'], where='mid', label='Demand-aware prices', color='salmon')
+    ax[0].set_ylabel('Feeder load (kWh)')
+    ax[0].set_title(f'Feeder Load: {scenario}')
+    ax[0].legend()
+    ax[0].grid(axis='y', linestyle='--', alpha=0.7)
+
+    ax[1].step(hours, base_prices, where='mid', label='Base prices', color='skyblue')
+    ax[1].step(hours, result['hourly_prices'], where='mid', label='Demand-aware prices', color='salmon')
+    ax[1].set_xlabel('Hour of the Day')
+    ax[1].set_ylabel('Electricity Price (€/kWh)')
+    ax[1].set_xticks(hours)
+    ax[1].legend()
+    ax[1].grid(axis='y', linestyle='--', alpha=0.7)
+
+    plt.tight_layout()
+    plt.savefig(f'{output_path}feeder_load_{scenario}.png')
+    plt.show()
+
+
+if __name__ == '__main__':
+    households = build_households(10000, day_type='workdays', seed=42)
+
+    start = time.perf_counter()
+    result = run_price_feedback(households, weekday=4, period='warm', elasticity=0.5)
+    elapsed = time.perf_counter() - start
+
+    initial_load = result['initial_feeder_load']
+    final_load = result['feeder_load']
+    print(f"{len(households['tot_energy'])} households, {result['iterations']} iterations "
+          f"({'converged' if result['converged'] else 'not converged'}) in {elapsed:.2f} s")
+    print(f"Peak feeder load: {initial_load.max():.1f} kWh -> {final_load.max():.1f} kWh")
+    print(f"Peak-to-average ratio: {initial_load.max() / initial_load.mean():.2f} -> "
+          f"{final_load.max() / final_load.mean():.2f}")
+    print(f"Average expenses: {result['expenses'].mean():.4f} €")
+
+    plot_feeder_load(result, expected_hourly_prices(4, 'warm'), 'Workdays (Warm)')
@@ -0,0 +1,290 @@
+import argparse
+import itertools
+import json
+import numpy as np
+
+DAYHOURS = 24
+STORE_DTYPE = np.float32
+DEFAULT_CHUNK_ROWS = 500_000
+
+
+def strip_utc_offsets(timestamps):
+    """
+    Remove the UTC offset ('Z', '+02:00', '-0500', ...) of ISO timestamps, keeping their local wall-clock time
+    (the UTC time plus the offset), so that numpy does not convert them to UTC.
+    """
+    timestamps = np.char.strip(timestamps)
+    lengths = np.char.str_len(timestamps)
+    ends = lengths.copy()
+    # The offset starts after the date, whose own '-' separators end at index 7
+    for marker in ('+', '-', 'Z', 'z'):
+        positions = np.char.find(timestamps, marker, 10)
+        ends = np.where(positions >= 0, np.minimum(ends, positions), ends)
+    if (ends == lengths).all():
+        return timestamps
+    return np.array([timestamp[:end] for timestamp, end in zip(timestamps.tolist(), ends.tolist())])
+
+
+def iter_csv_chunks(csv_path, chunk_rows=DEFAULT_CHUNK_ROWS, timestamp_column=0, value_column=1,
+                    delimiter=',', skip_header=1):
+    """
+    Stream a (timestamp, value) time series from a CSV file in chunks of rows.
+
+    Timestamps must be ISO-like times (e.g. '2021-06-01 13:00' or '2021-06-01T13:15:00'), optionally with
+    a UTC offset (e.g. '2021-06-01T13:00:00+02:00'). Readings are binned by their local wall-clock hour:
+    the offset is dropped rather than used to convert the time to UTC.
+
+    Parameters:
+        csv_path: Path of the CSV file.
+        chunk_rows: Number of rows parsed at once.
+        timestamp_column: Index of the column holding timestamps.
+        value_column: Index of the column holding values.
+        delimiter: Column separator.
+        skip_header: Number of header lines to skip.
+
+    Yields:
+        Pairs of arrays (hours as datetime64[h], values as float64) for each chunk.
+    """
+    with open(csv_path, 'r') as f:
+        for _ in range(skip_header):
+            next(f, None)
+        while True:
+            lines = list(itertools.islice(f, chunk_rows))
+            if not lines:
+                return
+            columns = np.loadtxt(lines, delimiter=delimiter, dtype=str,
+                                 usecols=(timestamp_column, value_column), ndmin=2)
+            timestamps = strip_utc_offsets(columns[:, 0])
+            yield timestamps.astype('datetime64[h]'), columns[:, 1].astype(np.float64)
+
+
+def fill_short_gaps(hourly, max_gap_hours):
+    """
+    Fill, in place, the runs of at most max_gap_hours missing (NaN) hours that lie between two observed hours,
+    by linear interpolation.
+
+    Returns:
+        The number of filled hours.
+    """
+    missing = np.flatnonzero(np.isnan(hourly))
+    observed = np.flatnonzero(~np.isnan(hourly))
+    if max_gap_hours <= 0 or len(missing) == 0 or len(observed) < 2:
+        return 0
+
+    following = np.searchsorted(observed, missing)
+    inner = (following > 0) & (following < len(observed))
+    missing, following = missing[inner], following[inner]
+    gap_lengths = observed[following] - observed[following - 1] - 1
+    missing = missing[gap_lengths <= max_gap_hours]
+    hourly[missing] = np.interp(missing, observed, hourly[observed])
+    return len(missing)
+
+
+def convert_csv_to_store(csv_path, store_path, kind, unit, scale=1.0, aggregate='sum', max_gap_hours=1,
+                         chunk_rows=DEFAULT_CHUNK_ROWS, **csv_options):
+    """
+    Convert an hourly (or finer) CSV time series into a binary store that can be memory-mapped.
+
+    The store is made of two files: '<store_path>.npy', a (days x 24) array with NaN for missing
+    hours, and '<store_path>.json' with its metadata. The CSV is parsed only once, in chunks.
+
+    Days are stored on the local wall clock, so the days on which daylight saving time starts or ends
+    have 23 or 25 hours of readings. The hour repeated when it ends holds the readings of both hours,
+    combined like any other readings of the same hour, and the hour skipped when it starts is filled
+    by interpolation (as are other short gaps, up to max_gap_hours).
+
+    Parameters:
+        csv_path: Path of the CSV file.
+        store_path: Path of the store, without extension.
+        kind: Kind of data stored (e.g. 'pv', 'price').
+        unit: Unit of the stored values.
+        scale: Factor applied to every value before storing.
+        aggregate: How readings falling in the same hour are combined ('sum' or 'mean').
+        max_gap_hours: Longest run of missing hours filled by interpolation (0 to keep every gap).
+        chunk_rows: Number of rows parsed at once.
+        csv_options: Extra options for iter_csv_chunks.
+
+    Returns:
+        The opened HistoricalStore.
+    """
+    assert aggregate in ('sum', 'mean')
+
+    # Hourly accumulators covering [start_hour, start_hour + len(sums)), grown as new hours appear
+    start_hour = None
+    sums = np.zeros(0)
+    counts = np.zeros(0, dtype=np.int64)
+
+    for hours, values in iter_csv_chunks(csv_path, chunk_rows=chunk_rows, **csv_options):
+        if len(hours) == 0:
+            continue
+        chunk_start = hours.min()
+        chunk_end = hours.max() + 1
+        if start_hour is None:
+            start_hour = chunk_start
+        end_hour = start_hour + len(sums)
+
+        # Extend the accumulators to cover the hours of this chunk
+        pad_before = max(0, int((start_hour - chunk_start).astype(np.int64)))
+        pad_after = max(0, int((chunk_end - end_hour).astype(np.int64)))
+        if pad_before or pad_after:
+            sums = np.pad(sums, (pad_before, pad_after))
+            counts = np.pad(counts, (pad_before, pad_after))
+            start_hour = min(start_hour, chunk_start)
+
+        indexes = (hours - start_hour).astype(np.int64)
+        np.add.at(sums, indexes, values * scale)
+        np.add.at(counts, indexes, 1)
+
+    if start_hour is None:
+        raise ValueError(f"No data found in '{csv_path}'.")
+
+    # Align the series on whole days
+    start_day = start_hour.astype('datetime64[D]')
+    offset = int((start_hour - start_day.astype('datetime64[h]')).astype(np.int64))
+    n_days = -(-(offset + len(sums)) // DAYHOURS)
+
+    hourly = np.full(n_days * DAYHOURS, np.nan)
+    observed = counts > 0
+    if aggregate == 'mean':
+        sums[observed] /= counts[observed]
+    hourly[offset:offset + len(sums)][observed] = sums[observed]
+    fill_short_gaps(hourly, max_gap_hours)
+
+    store = np.lib.format.open_memmap(store_path + '.npy', mode='w+', dtype=STORE_DTYPE, shape=(n_days, DAYHOURS))
+    store[:] = hourly.reshape(n_days, DAYHOURS)
+    store.flush()
+    del store
+
+    with open(store_path + '.json', 'w') as f:
+        json.dump({'kind': kind, 'unit': unit, 'start_day': str(start_day), 'days': n_days}, f, indent=4)
+
+    return HistoricalStore(store_path)
+
+
+def convert_pv_csv(csv_path, store_path, installed_kw, **kwargs):
+    """
+    Convert PV production readings (kWh) into a store of kWh per kW of installed PV,
+    the same unit as the profiles in pv_generation.
+    """
+    return convert_csv_to_store(csv_path, store_path, kind='pv', unit='kWh/kW', scale=1 / installed_kw,
+                                aggregate='sum', **kwargs)
+
+
+def convert_price_csv(csv_path, store_path, price_scale=1.0, **kwargs):
+    """
+    Convert market prices into a store of €/kWh prices.
+    Use price_scale=0.001 for prices published in €/MWh (e.g. PUN).
+    """
+    return convert_csv_to_store(csv_path, store_path, kind='price', unit='€/kWh', scale=price_scale,
+                                aggregate='mean', **kwargs)
+
+
+class HistoricalStore:
+    """
+    Memory-mapped (days x 24) hourly time series created by convert_csv_to_store.
+    """
+    __slots__ = ('values', 'start_day', 'kind', 'unit')
+
+    def __init__(self, store_path):
+        with open(store_path + '.json', 'r') as f:
+            metadata = json.load(f)
+        self.values = np.load(store_path + '.npy', mmap_mode='r')
+        self.start_day = np.datetime64(metadata['start_day'], 'D')
+        self.kind = metadata['kind']
+        self.unit = metadata['unit']
+
+    def __len__(self):
+        return len(self.values)
+
+    def __contains__(self, date):
+        index = self.day_index(date)
+        return 0 <= index < len(self.values) and not np.isnan(self.values[index]).any()
+
+    def day_index(self, date):
+        return int((np.datetime64(date, 'D') - self.start_day).astype(np.int64))
+
+    def days(self):
+        """
+        Return the dates covered by the store.
+        """
+        return self.start_day + np.arange(len(self.values))
+
+    def day(self, date):
+        """
+        Return the 24 hourly values of a given date.
+
+        Parameters:
+            date: Date as a string ('2021-06-01'), datetime.date or datetime64.
+
+        Returns:
+            An array with one value per hour of the day.
+        """
+        index = self.day_index(date)
+        if not 0 <= index < len(self.values):
+            raise KeyError(f"Date {date} is outside the {self.kind} store "
+                           f"({self.start_day} - {self.start_day + len(self.values) - 1}).")
+        values = np.asarray(self.values[index], dtype=np.float64)
+        if np.isnan(values).any():
+            raise ValueError(f"The {self.kind} store has missing hours on {date}.")
+        return values
+
+
+def get_weekday(date):
+    """
+    Return the day of the week of a date (0=Monday, ..., 6=Sunday).
+    """
+    return int((np.datetime64(date, 'D').astype(np.int64) + 3) % 7)
+
+
+def get_period(date):
+    """
+    Return the seasonal period of a date: 'warm' from April to September, 'cold' otherwise.
+    """
+    month = int(np.datetime64(date, 'M').astype(np.int64) % 12) + 1
+    return 'warm' if 4 <= month <= 9 else 'cold'
+
+
+def historical_day(date, pv_store=None, price_store=None):
+    """
+    Collect the inputs of a historical day, to be passed as keyword arguments to
+    generate_scheduling and simulation in place of the average profiles and random shifts.
+
+    Parameters:
+        date: Date of the day.
+        pv_store: Optional HistoricalStore with PV production (kWh/kW).
+        price_store: Optional HistoricalStore with electricity prices (€/kWh).
+
+    Returns:
+        A dictionary with 'weekday', 'period' and, if the stores are given, 'pv_profile' and 'hourly_prices'.
+    """
+    inputs = {'weekday': get_weekday(date), 'period': get_period(date)}
+    if pv_store is not None:
+        inputs['pv_profile'] = dict(enumerate(pv_store.day(date)))
+    if price_store is not None:
+        inputs['hourly_prices'] = dict(enumerate(price_store.day(date)))
+    return inputs
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Convert historical CSV time series into memory-mapped stores.')
+    parser.add_argument('kind', choices=['pv', 'price'], help='Kind of time series')
+    parser.add_argument('csv_path', help='CSV file with timestamp and value columns')
+    parser.add_argument('store_path', help='Path of the store, without extension')
+    parser.add_argument('--installed-kw', type=float, default=1.0, help='Installed PV power (pv only)')
+    parser.add_argument('--price-scale', type=float, default=1.0, help='Factor converting prices to €/kWh (price only)')
+    parser.add_argument('--chunk-rows', type=int, default=DEFAULT_CHUNK_ROWS, help='Rows parsed at once')
+    parser.add_argument('--delimiter', default=',', help='Column separator')
+    parser.add_argument('--max-gap-hours', type=int, default=1, help='Longest run of missing hours interpolated')
+    args = parser.parse_args()
+
+    if args.kind == 'pv':
+        converted = convert_pv_csv(args.csv_path, args.store_path, args.installed_kw,
+                                   max_gap_hours=args.max_gap_hours, chunk_rows=args.chunk_rows,
+                                   delimiter=args.delimiter)
+    else:
+        converted = convert_price_csv(args.csv_path, args.store_path, args.price_scale,
+                                      max_gap_hours=args.max_gap_hours, chunk_rows=args.chunk_rows,
+                                      delimiter=args.delimiter)
+
+    print(f"Stored {len(converted)} days of {converted.kind} data ({converted.unit}) "
+          f"starting on {converted.start_day}.")
@@ -0,0 +1,59 @@
+import zlib
+import numpy as np
+
+
+def make_rng(seed, scenario=0, day=0, household=0):
+    """
+    Create the random generator of a given scenario, day and household.
+
+    The generator is the one obtained by spawning the SeedSequence of the seed three times
+    (scenario, then day, then household), but it is built directly from its spawn key. Streams are
+    therefore independent of each other and do not depend on the order, the process or the
+    chunk in which they are used.
+
+    Parameters:
+        seed: Root seed.
+        scenario: Index of the scenario.
+        day: Index of the day.
+        household: Index of the household.
+
+    Returns:
+        A numpy.random.Generator.
+    """
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(scenario, day, household)))
+
+
+def household_rngs(seed, households, scenario=0, day=0):
+    """
+    Create the random generators of several households of the same scenario and day.
+
+    Parameters:
+        seed: Root seed.
+        households: Number of households, or iterable of household indexes (e.g. range(1000, 2000) for a chunk).
+        scenario: Index of the scenario.
+        day: Index of the day.
+
+    Returns:
+        A list of numpy.random.Generator, one per household.
+    """
+    if isinstance(households, (int, np.integer)):
+        households = range(households)
+    return [make_rng(seed, scenario, day, household) for household in households]
+
+
+def scenario_stream(season, tariff, weekday):
+    """
+    Return a stable scenario index for make_rng, derived from what the simulated day depends on.
+
+    The index only depends on its arguments (not on the position of the scenario in a list), so the
+    same scenario always gets the same stream, whichever script runs it and however runs are split.
+
+    Parameters:
+        season: Seasonal period (e.g. 'warm').
+        tariff: Name of the tariff (the season's own price slots are named after the season).
+        weekday: Day of the week.
+
+    Returns:
+        A non-negative integer.
+    """
+    return zlib.crc32(f'{season}|{tariff}|{weekday}'.encode('utf-8'))
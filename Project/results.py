@@ -0,0 +1,221 @@
+import numpy as np
+from scheduling import Hyperparameters
+
+DAYHOURS = 24
+
+# One field per Hyperparameters slot, stored as a structured array (one record per scenario)
+HYPERPARAMETERS_DTYPE = np.dtype([(name, np.float64) for name in Hyperparameters.__slots__])
+
+# Hourly quantities, each stored as a (scenarios x 24) array
+HOURLY_FIELDS = (
+    'initial_scheduling',
+    'optimized_scheduling',
+    'hourly_costs_initial',
+    'hourly_costs_optimized',
+    'constraints_min',
+    'constraints_max',
+)
+
+# Scalar quantities, each stored as a (scenarios,) array
+SCALAR_FIELDS = (
+    'initial_expenses',
+    'optimized_expenses',
+)
+
+
+def hourly_to_array(hourly_values):
+    """
+    Convert an hour -> value dictionary into an array of 24 values (missing hours are 0).
+    """
+    return np.array([hourly_values.get(hour, 0) for hour in range(DAYHOURS)], dtype=np.float64)
+
+
+def array_to_hourly(values):
+    """
+    Convert an array of 24 values back into an hour -> value dictionary.
+    """
+    return {hour: float(values[hour]) for hour in range(DAYHOURS)}
+
+
+def hyperparameters_to_record(hyperparameters: Hyperparameters):
+    """
+    Convert a Hyperparameters object into a tuple matching HYPERPARAMETERS_DTYPE.
+    """
+    return tuple(getattr(hyperparameters, name) for name in HYPERPARAMETERS_DTYPE.names)
+
+
+class ScenarioResults:
+    """
+    Columnar container for the results of many scenarios.
+
+    Every quantity is a NumPy array whose first axis is the scenario index, so that slicing
+    with a basic slice (e.g. results[10:20]) returns views without copying any data.
+    """
+    __slots__ = ('scenarios', 'hyperparameters') + SCALAR_FIELDS + HOURLY_FIELDS
+
+    def __init__(self, scenarios, hyperparameters, **columns):
+        """
+        Parameters:
+            scenarios: Array of scenario labels.
+            hyperparameters: Structured array with HYPERPARAMETERS_DTYPE.
+            columns: One array per name in SCALAR_FIELDS and HOURLY_FIELDS.
+        """
+        self.scenarios = np.asarray(scenarios, dtype=np.str_)
+        self.hyperparameters = np.asarray(hyperparameters, dtype=HYPERPARAMETERS_DTYPE)
+        count = len(self.scenarios)
+        assert self.hyperparameters.shape == (count,)
+
+        for name in SCALAR_FIELDS:
+            values = np.asarray(columns[name], dtype=np.float64)
+            assert values.shape == (count,), f"'{name}' must have shape ({count},)"
+            setattr(self, name, values)
+
+        for name in HOURLY_FIELDS:
+            values = np.asarray(columns[name], dtype=np.float64)
+            assert values.shape == (count, DAYHOURS), f"'{name}' must have shape ({count}, {DAYHOURS})"
+            setattr(self, name, values)
+
+    @classmethod
+    def empty(cls, count):
+        """
+        Allocate zero-filled results for a given number of scenarios, to be filled in place
+        with set_record.
+        """
+        columns = {name: np.zeros(count) for name in SCALAR_FIELDS}
+        columns.update({name: np.zeros((count, DAYHOURS)) for name in HOURLY_FIELDS})
+        return cls(np.full(count, '', dtype='U1'), np.zeros(count, dtype=HYPERPARAMETERS_DTYPE), **columns)
+
+    @classmethod
+    def from_records(cls, records):
+        """
+        Build columnar results from the list of dictionaries returned by compare_scenarios.
+        """
+        results = cls.empty(len(records))
+        results.scenarios = np.array([record['scenario'] for record in records], dtype=np.str_)
+        for index, record in enumerate(records):
+            results.set_record(index, record)
+        return results
+
+    def set_record(self, index, record):
+        """
+        Store a single compare_scenarios-style dictionary at the given scenario index.
+        The label array is widened (copied) if the scenario name does not fit in it.
+        """
+        label = record['scenario']
+        if len(label) > self.scenarios.dtype.itemsize // np.dtype('U1').itemsize:
+            self.scenarios = self.scenarios.astype(f'U{len(label)}')
+        self.scenarios[index] = label
+        self.hyperparameters[index] = hyperparameters_to_record(record['best_hyperparameters'])
+        for name in SCALAR_FIELDS:
+            getattr(self, name)[index] = record[name]
+        for name in HOURLY_FIELDS:
+            getattr(self, name)[index] = hourly_to_array(record[name])
+
+    def record(self, index):
+        """
+        Rebuild the compare_scenarios-style dictionary for a single scenario.
+        """
+        record = {
+            'scenario': str(self.scenarios[index]),
+            'best_hyperparameters': self.best_hyperparameters(index),
+        }
+        for name in SCALAR_FIELDS:
+            record[name] = float(getattr(self, name)[index])
+        for name in HOURLY_FIELDS:
+            record[name] = array_to_hourly(getattr(self, name)[index])
+        return record
+
+    def best_hyperparameters(self, index):
+        """
+        Return the Hyperparameters object of a single scenario.
+        """
+        return Hyperparameters(*(float(value) for value in self.hyperparameters[index]))
+
+    def __len__(self):
+        return len(self.scenarios)
+
+    def __getitem__(self, index):
+        """
+        Select a subset of scenarios. Basic slices return views, index arrays and masks return copies.
+        An integer index selects a single scenario (as a view) and raises IndexError if out of range.
+        """
+        if isinstance(index, (int, np.integer)):
+            position = range(len(self))[index]
+            index = slice(position, position + 1)
+        return ScenarioResults(self.scenarios[index], self.hyperparameters[index],
+                               **{name: getattr(self, name)[index] for name in SCALAR_FIELDS + HOURLY_FIELDS})
+
+    def columns(self):
+        """
+        Return all quantities as a name -> array dictionary (no data is copied).
+        Hyperparameter fields are exposed as separate columns named 'hp_<field>'.
+        """
+        columns = {'scenarios': self.scenarios}
+        for name in HYPERPARAMETERS_DTYPE.names:
+            columns[f'hp_{name}'] = self.hyperparameters[name]
+        for name in SCALAR_FIELDS + HOURLY_FIELDS:
+            columns[name] = getattr(self, name)
+        return columns
+
+    def to_buffers(self):
+        """
+        Export every numeric column as a contiguous buffer, in the layout used by Arrow:
+        scalar columns are plain value buffers, hourly columns are fixed-size lists of 24 values
+        and scenario labels are UTF-8 data with int32 offsets.
+
+        Buffers are memoryviews on the underlying arrays, so nothing is copied except for
+        strided data: the hyperparameter fields (interleaved in the structured array) and
+        results obtained with a stepped slice.
+
+        Returns:
+            A dictionary mapping each column name to a memoryview (labels map to an
+            (offsets, data) pair).
+        """
+        buffers = {}
+        for name, values in self.columns().items():
+            if name == 'scenarios':
+                encoded = [label.encode('utf-8') for label in values.tolist()]
+                offsets = np.zeros(len(encoded) + 1, dtype=np.int32)
+                np.cumsum([len(label) for label in encoded], out=offsets[1:])
+                buffers[name] = (memoryview(offsets), memoryview(b''.join(encoded)))
+            else:
+                buffers[name] = memoryview(np.ascontiguousarray(values))
+        return buffers
+
+    def to_npz(self, path, compressed=False):
+        """
+        Save all columns to a NumPy .npz archive.
+        """
+        save = np.savez_compressed if compressed else np.savez
+        save(path, scenarios=self.scenarios, hyperparameters=self.hyperparameters,
+             **{name: getattr(self, name) for name in SCALAR_FIELDS + HOURLY_FIELDS})
+
+    @classmethod
+    def from_npz(cls, path):
+        """
+        Load results saved with to_npz.
+        """
+        with np.load(path) as archive:
+            return cls(archive['scenarios'], archive['hyperparameters'],
+                       **{name: archive[name] for name in SCALAR_FIELDS + HOURLY_FIELDS})
+
+    def to_csv(self, path):
+        """
+        Save the results as a CSV file with one row per scenario and one column per hour
+        of each hourly quantity (e.g. 'optimized_scheduling_7').
+        """
+        header = ['scenario'] + [f'hp_{name}' for name in HYPERPARAMETERS_DTYPE.names] + list(SCALAR_FIELDS)
+        for name in HOURLY_FIELDS:
+            header += [f'{name}_{hour}' for hour in range(DAYHOURS)]
+
+        numeric = np.column_stack(
+            [self.hyperparameters[name] for name in HYPERPARAMETERS_DTYPE.names]
+            + [getattr(self, name) for name in SCALAR_FIELDS]
+            + [getattr(self, name) for name in HOURLY_FIELDS]
+        )
+
+        with open(path, 'w') as f:
+            f.write(','.join(header) + '\n')
+            for label, row in zip(self.scenarios.tolist(), numeric):
+                f.write('"' + label.replace('"', '""') + '",')
+                np.savetxt(f, row[np.newaxis], fmt='%.10g', delimiter=',')
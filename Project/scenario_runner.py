@@ -0,0 +1,286 @@
+import argparse
+import itertools
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from electricity_prices import price_slots
+from ev_requirements import ev_requirements, DEFAULT_ENERGY
+from constraints_loader import load_constraints
+from scheduling import generate_scheduling, Hyperparameters
+from simulation import add_ev_constraints, draw_environment, simulation, grid_search_params, output_path
+from results import ScenarioResults, hyperparameters_to_record, HYPERPARAMETERS_DTYPE
+from random_streams import make_rng, scenario_stream
+
+SCENARIOS_FILE = 'scenarios.json'
+
+# Values used when neither the scenario nor the file defaults specify them
+DEFAULT_SCENARIO = {
+    'panels': 5,
+    'max_kw': 6,
+    'seed': 0,
+    'day': 0,  # Index of the simulated day, selecting an independent random stream for the same seed
+    'tariff': None,  # Defaults to the price slots of the season
+    'search': {'range': [0.1, 10], 'test_count': 5, 'screening': False},
+}
+DEFAULT_WEEKDAY = {'workdays': 4, 'weekend': 6}
+
+
+def load_scenario_matrix(scenarios_file=SCENARIOS_FILE):
+    """
+    Load the scenarios to run from a JSON file.
+
+    The file may contain:
+        - "defaults": values shared by every scenario.
+        - "matrix": lists of values whose cartesian product gives one scenario per combination.
+        - "scenarios": explicit list of scenarios.
+        - "tariffs": named tariffs (prices per time slot) that scenarios can refer to.
+
+    Each scenario has a season and a day type, and optionally a weekday, panels, energy, tariff,
+    seed, day, max_kw, search ({"range": [low, high], "test_count": n, "screening": bool}) and name.
+
+    Returns:
+        List of scenarios with every field filled in.
+    """
+    with open(scenarios_file, 'r') as f:
+        data = json.load(f)
+
+    defaults = {**DEFAULT_SCENARIO, **data.get('defaults', {})}
+    tariffs = {name: {int(slot): price for slot, price in slots.items()}
+               for name, slots in data.get('tariffs', {}).items()}
+
+    entries = []
+    matrix = data.get('matrix', {})
+    if matrix:
+        keys = list(matrix.keys())
+        for values in itertools.product(*(matrix[key] for key in keys)):
+            entries.append(dict(zip(keys, values)))
+    entries += data.get('scenarios', [])
+
+    if not entries:
+        raise ValueError(f"No scenarios found in '{scenarios_file}'.")
+
+    scenarios = []
+    for entry in entries:
+        scenario = {**defaults, **entry}
+        day_type = scenario['day_type']
+        scenario.setdefault('weekday', DEFAULT_WEEKDAY[day_type])
+        scenario.setdefault('energy', DEFAULT_ENERGY[day_type])
+        scenario['search'] = {**DEFAULT_SCENARIO['search'], **scenario['search']}
+
+        tariff_name = scenario['tariff'] or scenario['season']
+        if tariff_name in tariffs:
+            scenario['tariff_slots'] = tariffs[tariff_name]
+        elif tariff_name in price_slots:
+            scenario['tariff_slots'] = price_slots[tariff_name]
+        else:
+            raise ValueError(f"Tariff '{tariff_name}' not found.")
+        scenario['tariff'] = tariff_name
+
+        scenario.setdefault('name', f"{day_type.capitalize()} ({scenario['season'].capitalize()}) "
+                                    f"weekday={scenario['weekday']} panels={scenario['panels']} "
+                                    f"energy={scenario['energy']} tariff={tariff_name} seed={scenario['seed']} "
+                                    f"day={scenario['day']}")
+        scenarios.append(scenario)
+
+    return scenarios
+
+
+def constraints_key(scenario):
+    return scenario['day_type'], scenario['max_kw']
+
+
+def environment_key(scenario):
+    return scenario['season'], scenario['tariff'], scenario['weekday'], scenario['seed'], scenario['day']
+
+
+def task_key(scenario):
+    """
+    Key identifying the computation of a scenario: scenarios with the same key give the same result.
+    """
+    search = scenario['search']
+    return (constraints_key(scenario), environment_key(scenario), scenario['panels'], scenario['energy'],
+            tuple(search['range']), search['test_count'], search['screening'])
+
+
+def prepare_tasks(scenarios):
+    """
+    Group scenarios into tasks, computing each shared intermediate step only once.
+
+    Constraints (with EV requirements) are computed once per day type and power limit, the random
+    environment once per season, tariff, weekday, seed and day, and identical scenarios run only once.
+
+    The environment of a scenario is drawn in this process from the random stream given by its seed,
+    day and scenario_stream(season, tariff, weekday), so results do not depend on the number of workers,
+    on the order of the scenarios or on the order in which they complete.
+
+    Returns:
+        List of (task, names of the scenarios sharing the task) pairs.
+    """
+    constraints_cache = {}
+    environment_cache = {}
+    tasks = {}
+
+    for scenario in scenarios:
+        key = constraints_key(scenario)
+        if key not in constraints_cache:
+            day_type, max_kw = key
+            ev_config = ev_requirements[day_type]
+            constraints_min, constraints_max = load_constraints(day_type=day_type, max_kw=max_kw)
+            constraints_cache[key] = add_ev_constraints(
+                constraints_min, constraints_max, ev_config['charging_hours'], ev_config['total_energy'],
+                ev_config['power_limit'], max_kw=max_kw
+            )
+
+        key = environment_key(scenario)
+        if key not in environment_cache:
+            environment_cache[key] = draw_environment(
+                scenario['weekday'], scenario['season'], tariff=scenario['tariff_slots'],
+                rng=make_rng(scenario['seed'], day=scenario['day'],
+                             scenario=scenario_stream(scenario['season'], scenario['tariff'], scenario['weekday']))
+            )
+
+        key = task_key(scenario)
+        if key in tasks:
+            tasks[key][1].append(scenario['name'])
+            continue
+
+        constraints_min, constraints_max = constraints_cache[constraints_key(scenario)]
+        task = {
+            **scenario,
+            'constraints_min': constraints_min,
+            'constraints_max': constraints_max,
+            'environment': environment_cache[environment_key(scenario)],
+        }
+        tasks[key] = (task, [scenario['name']])
+
+    print(f"{len(scenarios)} scenarios: {len(tasks)} unique runs, {len(constraints_cache)} constraint sets, "
+          f"{len(environment_cache)} simulated environments.")
+    return list(tasks.values())
+
+
+def run_task(task):
+    """
+    Run a prepared scenario: initial scheduling, grid search and optimized scheduling.
+
+    Returns:
+        A dictionary in the format of compare_scenarios results (without the scenario name).
+    """
+    pv_profile, hourly_prices = task['environment']
+    scheduling_args = {
+        'weekday': task['weekday'],
+        'period': task['season'],
+        'tot_energy': task['energy'],
+        'constraints_min': task['constraints_min'],
+        'constraints_max': task['constraints_max'],
+        'max_kw': task['max_kw'],
+        'tariff': task['tariff_slots'],
+    }
+    simulation_args = {
+        'weekday': task['weekday'],
+        'pv_panels_count': task['panels'],
+        'period': task['season'],
+        'pv_profile': pv_profile,
+        'hourly_prices': hourly_prices,
+    }
+
+    initial_scheduling = generate_scheduling(hyperparameters=Hyperparameters(1, 1, 1, 1), **scheduling_args)
+    initial_expenses, _, hourly_costs_initial = simulation(scheduling=initial_scheduling, **simulation_args)
+
+    best_hp = grid_search_params(
+        weekday=task['weekday'],
+        period=task['season'],
+        tot_energy=task['energy'],
+        pv_panels_count=task['panels'],
+        constraints_min=task['constraints_min'],
+        constraints_max=task['constraints_max'],
+        hyperparameters_range=task['search']['range'],
+        hyperparameters_test_count=task['search']['test_count'],
+        max_kw=task['max_kw'],
+        tariff=task['tariff_slots'],
+        environment=task['environment'],
+        screening=task['search']['screening']
+    )
+
+    optimized_scheduling = generate_scheduling(hyperparameters=best_hp, **scheduling_args)
+    optimized_expenses, _, hourly_costs_optimized = simulation(scheduling=optimized_scheduling, **simulation_args)
+
+    return {
+        'initial_expenses': initial_expenses,
+        'optimized_expenses': optimized_expenses,
+        'hourly_costs_initial': hourly_costs_initial,
+        'hourly_costs_optimized': hourly_costs_optimized,
+        'initial_scheduling': initial_scheduling,
+        'optimized_scheduling': optimized_scheduling,
+        'best_hyperparameters': best_hp,
+        'constraints_min': task['constraints_min'],
+        'constraints_max': task['constraints_max'],
+    }
+
+
+def run_scenarios(scenarios, workers=None):
+    """
+    Run scenarios in parallel, yielding each result as soon as it is available.
+
+    Parameters:
+        scenarios: List of scenarios, as returned by load_scenario_matrix.
+        workers: Number of worker processes (default: number of CPUs). With 1, scenarios run in this process.
+
+    Yields:
+        compare_scenarios-style result dictionaries, in completion order.
+    """
+    tasks = prepare_tasks(scenarios)
+
+    if workers == 1:
+        for task, names in tasks:
+            result = run_task(task)
+            for name in names:
+                yield {'scenario': name, **result}
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = {executor.submit(run_task, task): names for task, names in tasks}
+        for future in as_completed(futures):
+            result = future.result()
+            for name in futures[future]:
+                yield {'scenario': name, **result}
+
+
+def result_to_json(result):
+    """
+    Convert a result dictionary into a JSON-serializable one.
+    """
+    converted = dict(result)
+    converted['best_hyperparameters'] = dict(zip(HYPERPARAMETERS_DTYPE.names,
+                                                 hyperparameters_to_record(result['best_hyperparameters'])))
+    return converted
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run a matrix of scheduling scenarios in parallel.')
+    parser.add_argument('scenarios_file', nargs='?', default=SCENARIOS_FILE, help='JSON file with the scenarios')
+    parser.add_argument('--workers', type=int, default=None, help='Number of worker processes')
+    parser.add_argument('--output', default=os.path.join(output_path, 'scenario_runs'),
+                        help='Output path, without extension (.jsonl is streamed, .npz is written at the end, '
+                             'with the completed scenarios only if a run fails)')
+    args = parser.parse_args()
+
+    scenarios = load_scenario_matrix(args.scenarios_file)
+
+    # Results are stored in columns as they arrive; if a run fails, the completed ones are still saved
+    results = ScenarioResults.empty(len(scenarios))
+    completed = 0
+    try:
+        with open(args.output + '.jsonl', 'w') as f:
+            for result in run_scenarios(scenarios, workers=args.workers):
+                f.write(json.dumps(result_to_json(result)) + '\n')
+                f.flush()
+                results.set_record(completed, result)
+                completed += 1
+                print(f"[{completed}/{len(scenarios)}] {result['scenario']}: "
+                      f"{result['initial_expenses']:.4f} € -> {result['optimized_expenses']:.4f} €")
+    finally:
+        results[:completed].to_npz(args.output + '.npz')
+
+
+if __name__ == '__main__':
+    main()
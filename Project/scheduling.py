@@ -1,8 +1,16 @@
+import numpy as np
 from pv_generation import pv_profiles
 from electricity_prices import get_price_slot, get_price_slots_scores
 
+# Residual energy (kWh) below which the scheduling is considered complete
+EXACT_TOLERANCE = 0.0001
+# Number of proportional passes of the coarse mode before the greedy assignment of the residual
+COARSE_PASSES = 5
+
 
 class Hyperparameters:
+    __slots__ = ('morning', 'afternoon', 'evening', 'night')
+
     def __init__(self, morning: float, afternoon: float, evening: float, night: float):
         self.morning = morning
         self.afternoon = afternoon
@@ -42,6 +50,10 @@ def compute_pv_factors(pv_profile):
     pv_min = min(pv_profile.values())
     pv_max = max(pv_profile.values())
 
+    # A flat profile (e.g. an overcast historical day) gives no preference to any hour
+    if pv_max == pv_min:
+        return {hour: 0 for hour in pv_profile.keys()}
+
     # Normalize PV factors to a range of [0, 1]
     return {
         hour: (pv_profile[hour] - pv_min) / (pv_max - pv_min)
@@ -49,6 +61,26 @@ def compute_pv_factors(pv_profile):
     }
 
 
+def compute_price_scores(weekday, period, hourly_prices=None, tariff=None):
+    """
+    Compute the price score of each hour, from 0 (most expensive) to 2 (cheapest).
+
+    Without hourly prices, the score is the rank of the hour's time slot among the period's slots
+    (or among the slots of the given tariff); slots with the same price share the same rank.
+    With hourly prices (e.g. a historical day), the score is proportional to how cheap the hour is.
+    """
+    dayhours = list(range(0, 24))
+    if hourly_prices is None:
+        price_slots_score = get_price_slots_scores(period, tariff)
+        return {hour: price_slots_score[get_price_slot(hour, weekday)] for hour in dayhours}
+
+    price_min = min(hourly_prices[hour] for hour in dayhours)
+    price_max = max(hourly_prices[hour] for hour in dayhours)
+    if price_max == price_min:
+        return {hour: 0 for hour in dayhours}
+    return {hour: 2 * (price_max - hourly_prices[hour]) / (price_max - price_min) for hour in dayhours}
+
+
 def evaluate_goodness(current_scheduling, max_scheduling, price_slot_score, pv_factor, hp_factor):
     """
     Evaluate the goodness of scheduling based on current usage, price, and other factors.
@@ -57,7 +89,9 @@ def evaluate_goodness(current_scheduling, max_scheduling, price_slot_score, pv_f
 
 
 def generate_scheduling(weekday, period, tot_energy, constraints_min, constraints_max,
-                        hyperparameters, max_kw=3):
+                        hyperparameters, max_kw=3, pv_profile=None, hourly_prices=None,
+                        tariff=None, tol=EXACT_TOLERANCE, max_passes=None, coarse=False,
+                        return_error_bounds=False):
     """
     Generate an energy scheduling plan based on constraints and optimization factors.
 
@@ -69,9 +103,22 @@ def generate_scheduling(weekday, period, tot_energy, constraints_min, constraint
         - constraints_max: Maximum energy constraints for each hour.
         - hyperparameters: Hyperparameters object with weighting factors.
         - max_kw: Maximum energy allowed per hour.
+        - pv_profile: Optional PV production for each hour (e.g. a historical day), replacing the period's profile.
+        - hourly_prices: Optional electricity price for each hour (e.g. a historical day), replacing the price slots.
+        - tariff: Optional prices per time slot, replacing the period's price slots.
+        - tol: Residual energy below which the distribution stops.
+        - max_passes: Optional maximum number of distribution passes.
+        - coarse: If True, stop after a few passes (COARSE_PASSES, unless max_passes is given) and
+          assign the residual energy in one greedy step, to the hours with the highest goodness.
+        - return_error_bounds: If True, also return bounds on the distance from the converged scheduling.
 
     Returns:
         - A dictionary with the energy scheduling for each hour.
+        - If return_error_bounds is True, a dictionary with:
+            - passes: Number of distribution passes performed.
+            - unassigned_energy: Energy left unscheduled (kWh).
+            - hour_error: Bound on the difference of any hour from the converged scheduling (kWh).
+            - energy_error: Bound on the sum over hours of the differences from the converged scheduling (kWh).
     """
     # Validate constraints
     dayhours = list(range(0, 24))
@@ -82,10 +129,11 @@ def generate_scheduling(weekday, period, tot_energy, constraints_min, constraint
     assert sum(constraints_max.values()) >= tot_energy
 
     # Load PV profile and compute factors
-    pv_profile = pv_profiles[period]
+    if pv_profile is None:
+        pv_profile = pv_profiles[period]
     pv_factors = compute_pv_factors(pv_profile)
     hp_factors = build_hp_factors(hyperparameters)
-    price_slots_score = get_price_slots_scores(period)
+    price_scores = compute_price_scores(weekday, period, hourly_prices, tariff)
 
     # Initialize scheduling and remaining energy
     scheduling = {hour: 0 for hour in dayhours}
@@ -96,14 +144,20 @@ def generate_scheduling(weekday, period, tot_energy, constraints_min, constraint
         remaining_energy -= constraints_min[hour]
         scheduling[hour] += constraints_min[hour]
 
+    if coarse and max_passes is None:
+        max_passes = COARSE_PASSES
+
     # Distribute remaining energy
-    while remaining_energy > 0.0001:
+    passes = 0
+    while remaining_energy > tol and (max_passes is None or passes < max_passes):
+        passes += 1
+
         # Calculate goodness factors for each hour
         goodness_factors = {
             hour: evaluate_goodness(
                 scheduling[hour],
                 max_kw,
-                price_slots_score.index(get_price_slot(hour, weekday)),
+                price_scores[hour],
                 pv_factors[hour],
                 hp_factors[hour]
             )
@@ -130,4 +184,165 @@ def generate_scheduling(weekday, period, tot_energy, constraints_min, constraint
             scheduling[hour] += energy_assigned
             remaining_energy -= energy_assigned
 
-    return scheduling
+    # Further passes would only add the residual energy on top of the current scheduling
+    residual_energy = max(remaining_energy, 0)
+
+    if coarse and remaining_energy > tol:
+        # Assign the residual energy to the best hours first, up to their maximum
+        goodness_factors = {
+            hour: evaluate_goodness(scheduling[hour], max_kw, price_scores[hour], pv_factors[hour], hp_factors[hour])
+            for hour in dayhours
+        }
+        for hour in sorted(dayhours, key=lambda h: goodness_factors[h], reverse=True):
+            max_energy = min(max_kw, constraints_max[hour])
+            energy_assigned = min(remaining_energy, max(max_energy - scheduling[hour], 0))
+            scheduling[hour] += energy_assigned
+            remaining_energy -= energy_assigned
+            if remaining_energy <= 0:
+                break
+
+    if not return_error_bounds:
+        return scheduling
+
+    greedy_energy = residual_energy - max(remaining_energy, 0)
+    return scheduling, {
+        'passes': passes,
+        'unassigned_energy': max(remaining_energy, 0),
+        'hour_error': residual_energy,
+        'energy_error': residual_energy + greedy_energy,
+    }
+
+
+# Index of the hyperparameter (morning, afternoon, evening, night) that weights each hour of the day
+HP_HOUR_INDEXES = np.array([build_hp_factors(Hyperparameters(0, 1, 2, 3))[hour] for hour in range(24)])
+
+
+def build_hp_factors_batch(hyperparameters):
+    """
+    Vectorized build_hp_factors: hourly weighting factors for many sets of hyperparameters.
+
+    Parameters:
+        - hyperparameters: Array of shape (..., 4) with morning, afternoon, evening and night values.
+
+    Returns:
+        - An array of shape (..., 24).
+    """
+    return np.asarray(hyperparameters, dtype=np.float64)[..., HP_HOUR_INDEXES]
+
+
+def compute_pv_factors_batch(pv_profile):
+    """
+    Vectorized compute_pv_factors: normalize each PV profile of shape (..., 24) to a range of [0, 1].
+    """
+    pv_profile = np.asarray(pv_profile, dtype=np.float64)
+    pv_min = pv_profile.min(axis=-1, keepdims=True)
+    pv_range = pv_profile.max(axis=-1, keepdims=True) - pv_min
+    return np.divide(pv_profile - pv_min, pv_range, out=np.zeros_like(pv_profile), where=pv_range > 0)
+
+
+def compute_price_scores_batch(hourly_prices):
+    """
+    Vectorized compute_price_scores for hourly prices of shape (..., 24): from 0 (most expensive) to 2 (cheapest).
+    """
+    hourly_prices = np.asarray(hourly_prices, dtype=np.float64)
+    price_max = hourly_prices.max(axis=-1, keepdims=True)
+    price_range = price_max - hourly_prices.min(axis=-1, keepdims=True)
+    return np.divide(2 * (price_max - hourly_prices), price_range, out=np.zeros_like(hourly_prices),
+                     where=price_range > 0)
+
+
+def generate_scheduling_batch(tot_energy, constraints_min, constraints_max, price_scores, pv_factors, hp_factors,
+                              max_kw=3, tol=EXACT_TOLERANCE, max_passes=None, coarse=False,
+                              return_error_bounds=False):
+    """
+    Vectorized generate_scheduling: schedule many households at once.
+
+    Every hourly argument is an array of shape (households, 24), or broadcastable to it
+    (e.g. a single (24,) profile shared by all households).
+
+    Parameters:
+        - tot_energy: Total energy to be scheduled for each household, shape (households,).
+        - constraints_min: Minimum energy constraints for each hour.
+        - constraints_max: Maximum energy constraints for each hour.
+        - price_scores: Price score of each hour, from 0 (most expensive) to 2 (cheapest).
+        - pv_factors: Normalized PV generation factors for each hour.
+        - hp_factors: Hyperparameter weighting factors for each hour.
+        - max_kw: Maximum energy allowed per hour.
+        - tol: Residual energy below which the distribution stops.
+        - max_passes: Optional maximum number of distribution passes.
+        - coarse: If True, stop after a few passes (COARSE_PASSES, unless max_passes is given) and
+          assign the residual energy in one greedy step, to the hours with the highest goodness.
+        - return_error_bounds: If True, also return bounds on the distance from the converged scheduling.
+
+    Returns:
+        - An array of shape (households, 24) with the energy scheduling of each household.
+        - If return_error_bounds is True, a dictionary of arrays of shape (households,) with the same
+          keys as in generate_scheduling: passes, unassigned_energy, hour_error and energy_error.
+    """
+    tot_energy = np.asarray(tot_energy, dtype=np.float64)
+    shape = (len(tot_energy), 24)
+    constraints_min = np.broadcast_to(np.asarray(constraints_min, dtype=np.float64), shape)
+    constraints_max = np.broadcast_to(np.asarray(constraints_max, dtype=np.float64), shape)
+
+    # Validate constraints
+    assert (constraints_min >= 0).all()
+    assert (constraints_max <= max_kw).all()
+    assert (constraints_min.sum(axis=1) <= tot_energy).all()
+    assert (constraints_max.sum(axis=1) >= tot_energy).all()
+
+    # Factors that do not depend on the current scheduling
+    preferences = np.broadcast_to(price_scores / 2 + pv_factors + hp_factors, shape)
+    max_energy = np.minimum(max_kw, constraints_max)
+
+    # Apply minimum consumption constraints
+    scheduling = constraints_min.copy()
+    remaining_energy = tot_energy - constraints_min.sum(axis=1)
+
+    if coarse and max_passes is None:
+        max_passes = COARSE_PASSES
+
+    # Distribute remaining energy, only for households that still have energy to assign
+    active = np.flatnonzero(remaining_energy > tol)
+    passes = np.zeros(shape[0], dtype=np.int64)
+    pass_count = 0
+    while len(active) and (max_passes is None or pass_count < max_passes):
+        pass_count += 1
+        passes[active] = pass_count
+        current = scheduling[active]
+        goodness_factors = (1 - (current / max_kw) ** 2) * preferences[active]
+        goodness_factors_norm = goodness_factors / goodness_factors.sum(axis=1, keepdims=True)
+
+        energy_assignments = remaining_energy[active, np.newaxis] * goodness_factors_norm
+        energy_assigned = np.minimum(energy_assignments, max_energy[active] - current)
+
+        scheduling[active] = current + energy_assigned
+        remaining_energy[active] -= energy_assigned.sum(axis=1)
+        active = active[remaining_energy[active] > tol]
+
+    # Further passes would only add the residual energy on top of the current scheduling
+    residual_energy = np.maximum(remaining_energy, 0)
+
+    if coarse and len(active):
+        # Assign the residual energy to the best hours first, up to their maximum
+        current = scheduling[active]
+        goodness_factors = (1 - (current / max_kw) ** 2) * preferences[active]
+        order = np.argsort(-goodness_factors, axis=1, kind='stable')
+        capacity = np.take_along_axis(np.maximum(max_energy[active] - current, 0), order, axis=1)
+        capacity_before = np.cumsum(capacity, axis=1) - capacity
+        energy_assigned = np.clip(remaining_energy[active, np.newaxis] - capacity_before, 0, capacity)
+
+        np.put_along_axis(current, order, np.take_along_axis(current, order, axis=1) + energy_assigned, axis=1)
+        scheduling[active] = current
+        remaining_energy[active] -= energy_assigned.sum(axis=1)
+
+    if not return_error_bounds:
+        return scheduling
+
+    unassigned_energy = np.maximum(remaining_energy, 0)
+    greedy_energy = residual_energy - unassigned_energy
+    return scheduling, {
+        'passes': passes,
+        'unassigned_energy': unassigned_energy,
+        'hour_error': residual_energy,
+        'energy_error': residual_energy + greedy_energy,
+    }
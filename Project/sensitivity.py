@@ -0,0 +1,344 @@
+import time
+import numpy as np
+from electricity_prices import price_slots, get_price_slot
+from pv_generation import pv_profiles
+from ev_requirements import ev_requirements, DEFAULT_ENERGY
+from constraints_loader import load_constraints
+from scheduling import Hyperparameters, build_hp_factors_batch, compute_pv_factors_batch, generate_scheduling_batch
+from simulation import add_ev_constraints, simulation_batch
+from results import hourly_to_array, hyperparameters_to_record
+from random_streams import make_rng
+
+# Inputs whose effect on the expenses is analysed, in the order of the columns of the samples
+PARAMETERS = (
+    'morning',
+    'afternoon',
+    'evening',
+    'night',
+    'pv_panels_count',
+    'price_slot_1',
+    'price_slot_2',
+    'price_slot_3',
+    'constraints_min_scale',
+    'constraints_max_scale',
+)
+
+
+def build_model(weekday, period, day_type, hyperparameters=None, pv_panels_count=5, tot_energy=None, max_kw=6):
+    """
+    Describe the scenario around which sensitivities are computed.
+
+    Parameters:
+        weekday: Day of the week.
+        period: Seasonal period.
+        day_type: Day type of the constraints and EV requirements.
+        hyperparameters: Hyperparameters of the reference point (default: all 1).
+        pv_panels_count: Number of solar panels of the reference point.
+        tot_energy: Total energy to be scheduled (default: the day type's default).
+        max_kw: Maximum energy allowed per hour.
+
+    Returns:
+        Dictionary with the scenario data and the reference values of PARAMETERS ('reference').
+    """
+    if hyperparameters is None:
+        hyperparameters = Hyperparameters(1, 1, 1, 1)
+    if tot_energy is None:
+        tot_energy = DEFAULT_ENERGY[day_type]
+
+    ev_config = ev_requirements[day_type]
+    constraints_min, constraints_max = load_constraints(day_type=day_type, max_kw=max_kw)
+    constraints_min, constraints_max = add_ev_constraints(
+        constraints_min, constraints_max, ev_config['charging_hours'], ev_config['total_energy'],
+        ev_config['power_limit'], max_kw=max_kw
+    )
+
+    slots = sorted(price_slots[period].keys())
+    reference = np.array(
+        hyperparameters_to_record(hyperparameters)
+        + (pv_panels_count,)
+        + tuple(price_slots[period][slot] for slot in slots)
+        + (1.0, 1.0)
+    )
+
+    return {
+        'period': period,
+        'tot_energy': tot_energy,
+        'max_kw': max_kw,
+        'constraints_min': hourly_to_array(constraints_min),
+        'constraints_max': hourly_to_array(constraints_max),
+        'pv_profile': hourly_to_array(pv_profiles[period]),
+        'hour_slots': np.array([slots.index(get_price_slot(hour, weekday)) for hour in range(24)]),
+        'reference': reference,
+    }
+
+
+def default_bounds(model):
+    """
+    Ranges of PARAMETERS used for the variance decomposition: the grid search range for the
+    hyperparameters, 0-10 panels, ±20% around the reference price of each slot and
+    ±50% (min) or ±25% (max) around the user-defined constraints.
+    """
+    reference = model['reference']
+    return np.array(
+        [(0.1, 10)] * 4
+        + [(0, 10)]
+        + [(0.8 * price, 1.2 * price) for price in reference[5:8]]
+        + [(0.5, 1.5), (0.75, 1.25)]
+    )
+
+
+def scaled_constraints(model, min_scales, max_scales):
+    """
+    Scale the constraints of the model, keeping them feasible.
+
+    Scaled minimums are reduced proportionally if they exceed the total energy, and scaled maximums are
+    kept between the minimums and max_kw, then raised towards max_kw if they cannot hold the total energy.
+
+    Returns:
+        Minimum and maximum constraints, arrays of shape (samples, 24).
+    """
+    tot_energy = model['tot_energy']
+    max_kw = model['max_kw']
+
+    constraints_min = np.clip(model['constraints_min'] * min_scales[:, np.newaxis], 0, max_kw)
+    min_total = constraints_min.sum(axis=1, keepdims=True)
+    constraints_min *= np.minimum(1, tot_energy * (1 - 1e-9) / np.maximum(min_total, 1e-12))
+
+    constraints_max = np.clip(model['constraints_max'] * max_scales[:, np.newaxis], constraints_min, max_kw)
+    missing_energy = tot_energy - constraints_max.sum(axis=1, keepdims=True)
+    headroom = (max_kw - constraints_max).sum(axis=1, keepdims=True)
+    raise_fraction = np.clip(missing_energy / np.maximum(headroom, 1e-12) * (1 + 1e-9), 0, 1)
+    constraints_max += (max_kw - constraints_max) * raise_fraction
+
+    return constraints_min, constraints_max
+
+
+def slot_price_ranks(slot_prices):
+    """
+    Vectorized get_price_slots_scores: rank of each slot price, from the most expensive (0) down,
+    slots with the same price sharing the same rank.
+
+    Parameters:
+        slot_prices: Array of shape (samples, slots).
+
+    Returns:
+        Integer array of the same shape.
+    """
+    order = np.argsort(-slot_prices, axis=1, kind='stable')
+    sorted_prices = np.take_along_axis(slot_prices, order, axis=1)
+    sorted_ranks = np.cumsum(np.diff(sorted_prices, axis=1, prepend=np.inf) != 0, axis=1) - 1
+    ranks = np.empty_like(sorted_ranks)
+    np.put_along_axis(ranks, order, sorted_ranks, axis=1)
+    return ranks
+
+
+def evaluate_expenses(model, samples, tol=1e-6, chunk_size=20000):
+    """
+    Compute the expenses of many input samples at once, on the batched scheduling and cost paths.
+
+    The PV production is the period's average profile and prices are the sampled slot prices,
+    so the expenses are a deterministic function of the samples.
+
+    Parameters:
+        model: Scenario, as returned by build_model.
+        samples: Array of shape (samples, len(PARAMETERS)).
+        tol: Residual energy below which the scheduling stops.
+        chunk_size: Number of samples evaluated at once, to bound memory use.
+
+    Returns:
+        Expenses of each sample.
+    """
+    samples = np.atleast_2d(np.asarray(samples, dtype=np.float64))
+    expenses = np.empty(len(samples))
+    pv_factors = compute_pv_factors_batch(model['pv_profile'])
+
+    for start in range(0, len(samples), chunk_size):
+        chunk = samples[start:start + chunk_size]
+        slot_prices = chunk[:, 5:8]
+        hourly_prices = slot_prices[:, model['hour_slots']]
+
+        price_scores = slot_price_ranks(slot_prices)[:, model['hour_slots']]
+
+        constraints_min, constraints_max = scaled_constraints(model, chunk[:, 8], chunk[:, 9])
+        scheduling = generate_scheduling_batch(
+            tot_energy=np.full(len(chunk), float(model['tot_energy'])),
+            constraints_min=constraints_min,
+            constraints_max=constraints_max,
+            price_scores=price_scores,
+            pv_factors=pv_factors,
+            hp_factors=build_hp_factors_batch(chunk[:, :4]),
+            max_kw=model['max_kw'],
+            tol=tol
+        )
+
+        solar_profile = chunk[:, 4:5] * model['pv_profile']
+        expenses[start:start + len(chunk)], _, _ = simulation_batch(scheduling, solar_profile, hourly_prices)
+
+    return expenses
+
+
+def finite_difference_sensitivities(model, points=None, relative_step=0.01, tol=1e-6):
+    """
+    Compute the derivatives of the expenses with respect to every parameter by central finite differences.
+
+    All the perturbed samples (two per parameter and point) are evaluated in a single batch.
+
+    Price scores depend on the rank of the slot prices, so the expenses jump when two slot prices cross.
+    The step of each slot price is therefore limited to half the distance to the nearest other slot price,
+    so that both perturbed points keep the ranks of the point. A slot price equal to another one sits on
+    such a jump: its derivative is not defined, and is returned as NaN and flagged in 'rank_ties'.
+
+    Parameters:
+        model: Scenario, as returned by build_model.
+        points: Optional array of shape (points, len(PARAMETERS)) at which derivatives are computed
+            (default: the model's reference point).
+        relative_step: Step of each parameter, relative to its value (absolute for a value of 0).
+        tol: Residual energy below which the scheduling stops.
+
+    Returns:
+        Dictionary with the 'expenses' at each point, and the 'derivatives', 'elasticities' (relative change
+        of the expenses per relative change of the parameter), 'steps' and 'rank_ties', all of shape
+        (points, len(PARAMETERS)).
+    """
+    points = np.atleast_2d(model['reference'] if points is None else np.asarray(points, dtype=np.float64))
+    n_points, n_parameters = points.shape
+    steps = relative_step * np.where(points == 0, 1, np.abs(points))
+
+    # Keep each slot price strictly between its neighbours
+    slot_prices = points[:, 5:8]
+    price_gaps = np.abs(slot_prices[:, :, np.newaxis] - slot_prices[:, np.newaxis, :])
+    price_gaps[:, np.arange(3), np.arange(3)] = np.inf
+    nearest_gaps = price_gaps.min(axis=2)
+    rank_ties = np.zeros(points.shape, dtype=bool)
+    rank_ties[:, 5:8] = nearest_gaps == 0
+    steps[:, 5:8] = np.where(rank_ties[:, 5:8], steps[:, 5:8], np.minimum(steps[:, 5:8], nearest_gaps / 2))
+
+    # Samples: the points, then each point moved forward and backward along each parameter
+    offsets = np.einsum('pi,ij->pij', steps, np.eye(n_parameters))
+    samples = np.concatenate([
+        points,
+        (points[:, np.newaxis, :] + offsets).reshape(-1, n_parameters),
+        (points[:, np.newaxis, :] - offsets).reshape(-1, n_parameters),
+    ])
+    values = evaluate_expenses(model, samples, tol=tol)
+
+    expenses = values[:n_points]
+    forward = values[n_points:n_points * (n_parameters + 1)].reshape(n_points, n_parameters)
+    backward = values[n_points * (n_parameters + 1):].reshape(n_points, n_parameters)
+    derivatives = np.where(rank_ties, np.nan, (forward - backward) / (2 * steps))
+
+    return {
+        'expenses': expenses,
+        'derivatives': derivatives,
+        'elasticities': derivatives * points / expenses[:, np.newaxis],
+        'steps': steps,
+        'rank_ties': rank_ties,
+    }
+
+
+def sobol_estimates(expenses_a, expenses_b, expenses_ab):
+    """
+    Saltelli (2010) first-order and Jansen total-order estimates from the expenses of the samples A, B
+    and AB_i (shape (parameters, samples)).
+    """
+    variance = np.var(np.concatenate([expenses_a, expenses_b]))
+    first_order = np.mean(expenses_b * (expenses_ab - expenses_a), axis=1) / variance
+    total_order = 0.5 * np.mean((expenses_a - expenses_ab) ** 2, axis=1) / variance
+    return first_order, total_order, variance
+
+
+def sobol_indices(model, bounds=None, n_samples=16384, seed=0, tol=1e-4, n_bootstrap=200, confidence=0.95):
+    """
+    Decompose the variance of the expenses over the parameters (Sobol indices).
+
+    Parameters are sampled uniformly within their bounds. First-order indices use the Saltelli (2010)
+    estimator and total-order indices the Jansen estimator, from n_samples * (len(PARAMETERS) + 2)
+    evaluations computed in batch. Confidence intervals are obtained by resampling the base samples
+    (bootstrap), without further evaluations.
+
+    Parameters:
+        model: Scenario, as returned by build_model.
+        bounds: Optional array of shape (len(PARAMETERS), 2) with the range of each parameter
+            (default: default_bounds(model)).
+        n_samples: Number of base samples.
+        seed: Random seed for reproducibility.
+        tol: Residual energy below which the scheduling stops.
+        n_bootstrap: Number of bootstrap resamples.
+        confidence: Confidence level of the intervals.
+
+    Returns:
+        Dictionary with the 'first_order' and 'total_order' index of each parameter, their confidence
+        intervals 'first_order_interval' and 'total_order_interval' (shape (len(PARAMETERS), 2)),
+        the 'variance' and 'mean' of the expenses and the number of 'evaluations'.
+    """
+    if bounds is None:
+        bounds = default_bounds(model)
+    bounds = np.asarray(bounds, dtype=np.float64)
+    n_parameters = len(bounds)
+
+    rng = make_rng(seed)
+    low, high = bounds[:, 0], bounds[:, 1]
+    samples_a = low + (high - low) * rng.random((n_samples, n_parameters))
+    samples_b = low + (high - low) * rng.random((n_samples, n_parameters))
+
+    # AB_i: samples of A with the i-th parameter taken from B
+    samples_ab = np.repeat(samples_a[np.newaxis], n_parameters, axis=0)
+    samples_ab[np.arange(n_parameters), :, np.arange(n_parameters)] = samples_b.T
+
+    values = evaluate_expenses(model, np.concatenate([samples_a, samples_b, samples_ab.reshape(-1, n_parameters)]),
+                               tol=tol)
+    expenses_a = values[:n_samples]
+    expenses_b = values[n_samples:2 * n_samples]
+    expenses_ab = values[2 * n_samples:].reshape(n_parameters, n_samples)
+    first_order, total_order, variance = sobol_estimates(expenses_a, expenses_b, expenses_ab)
+
+    # Bootstrap: the same estimators on base samples drawn with replacement
+    bootstrap_first_order = np.empty((n_bootstrap, n_parameters))
+    bootstrap_total_order = np.empty((n_bootstrap, n_parameters))
+    for index in range(n_bootstrap):
+        resample = rng.integers(0, n_samples, n_samples)
+        bootstrap_first_order[index], bootstrap_total_order[index], _ = sobol_estimates(
+            expenses_a[resample], expenses_b[resample], expenses_ab[:, resample]
+        )
+    quantiles = [(1 - confidence) / 2, (1 + confidence) / 2]
+
+    return {
+        'first_order': first_order,
+        'total_order': total_order,
+        'first_order_interval': np.quantile(bootstrap_first_order, quantiles, axis=0).T,
+        'total_order_interval': np.quantile(bootstrap_total_order, quantiles, axis=0).T,
+        'variance': variance,
+        'mean': np.mean(np.concatenate([expenses_a, expenses_b])),
+        'evaluations': len(values),
+    }
+
+
+if __name__ == '__main__':
+    scenarios = [
+        {"season": "warm", "day_type": "workdays", "weekday": 4},
+        {"season": "warm", "day_type": "weekend", "weekday": 6},
+        {"season": "cold", "day_type": "workdays", "weekday": 4},
+        {"season": "cold", "day_type": "weekend", "weekday": 6},
+    ]
+
+    for scenario in scenarios:
+        model = build_model(scenario['weekday'], scenario['season'], scenario['day_type'])
+
+        start = time.perf_counter()
+        fd = finite_difference_sensitivities(model)
+        sobol = sobol_indices(model, seed=42)
+        elapsed = time.perf_counter() - start
+
+        print(f"\n{scenario['day_type'].capitalize()} ({scenario['season'].capitalize()}): "
+              f"expenses {fd['expenses'][0]:.4f} €, {sobol['evaluations'] + 2 * len(PARAMETERS) + 1} "
+              f"evaluations in {elapsed:.2f} s")
+        print(f"{'Parameter':<24}{'Derivative':>12}{'Elasticity':>12}{'Sobol S1 (95% CI)':>26}"
+              f"{'Sobol ST (95% CI)':>26}")
+        for index in np.argsort(-sobol['total_order']):
+            first_low, first_high = sobol['first_order_interval'][index]
+            total_low, total_high = sobol['total_order_interval'][index]
+            print(f"{PARAMETERS[index]:<24}{fd['derivatives'][0, index]:>12.4f}{fd['elasticities'][0, index]:>12.4f}"
+                  f"{sobol['first_order'][index]:>10.3f} [{first_low:>6.3f},{first_high:>6.3f}]"
+                  f"{sobol['total_order'][index]:>10.3f} [{total_low:>6.3f},{total_high:>6.3f}]")
+        if fd['rank_ties'][0].any():
+            print("Derivatives of slot prices equal to another slot price are not defined (nan).")
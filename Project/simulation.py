@@ -1,51 +1,93 @@
+import itertools
 import numpy as np
 from electricity_prices import price_slots, get_price_slot
 from pv_generation import pv_profiles
-from scheduling import generate_scheduling, Hyperparameters
-from ev_requirements import ev_requirements
+from scheduling import (generate_scheduling, Hyperparameters, EXACT_TOLERANCE, compute_pv_factors,
+                        compute_price_scores, build_hp_factors_batch, generate_scheduling_batch)
+from ev_requirements import ev_requirements, DEFAULT_ENERGY
 import matplotlib.pyplot as plt
 import os
 from constraints_loader import load_constraints
+from results import ScenarioResults, hourly_to_array
+from random_streams import make_rng, scenario_stream
 
 output_path = './output/'
 if not os.path.exists(output_path):
     os.makedirs(output_path)
 
 
-def shift_value(value):
+def shift_value(value, rng):
     """
-    Apply a random shift to a given value to simulate variability.
+    Apply a random shift to a given value (or array of values) to simulate variability.
     Ensures the shifted value stays within specified bounds.
+
+    Parameters:
+        value: Value or array of values to shift.
+        rng: numpy.random.Generator used for the draws.
     """
+    values = np.atleast_1d(np.asarray(value, dtype=np.float64))
     lower_bound = 0
-    upper_bound = 2 * value
-    std_dev = 0.1 * value
-    while True:
-        shifted_value = np.random.normal(loc=value, scale=std_dev)
-        if lower_bound <= shifted_value <= upper_bound:
-            return shifted_value
+    upper_bound = 2 * values
+    std_dev = 0.1 * values
+
+    shifted_values = rng.normal(loc=values, scale=std_dev)
+    out_of_bounds = (shifted_values < lower_bound) | (shifted_values > upper_bound)
+    while out_of_bounds.any():
+        shifted_values[out_of_bounds] = rng.normal(loc=values[out_of_bounds], scale=std_dev[out_of_bounds])
+        out_of_bounds = (shifted_values < lower_bound) | (shifted_values > upper_bound)
 
+    return shifted_values if np.ndim(value) else shifted_values[0]
 
-def generate_solar_profile(period, n_panels):
+
+def generate_solar_profile(period, n_panels, rng):
     """
     Generate a solar energy production profile for a given period and number of panels.
     """
+    hours = list(pv_profiles[period].keys())
+    shifted_kwh = shift_value([pv_profiles[period][hour] for hour in hours], rng)
     return {
-        hour: n_panels * shift_value(kwh)
-        for hour, kwh in pv_profiles[period].items()
+        hour: n_panels * kwh
+        for hour, kwh in zip(hours, shifted_kwh)
     }
 
 
-def generate_price_slots(period):
+def generate_price_slots(period, rng, tariff=None):
     """
-    Generate randomized electricity price slots based on existing price data.
+    Generate randomized electricity price slots based on existing price data
+    (or on the given tariff, a dictionary of prices per time slot).
     """
+    if tariff is None:
+        tariff = price_slots[period]
+    slots = list(tariff.keys())
+    shifted_prices = shift_value([tariff[slot] for slot in slots], rng)
     return {
-        slot: shift_value(price)
-        for slot, price in price_slots[period].items()
+        slot: price
+        for slot, price in zip(slots, shifted_prices)
     }
 
 
+def draw_environment(weekday, period, seed=0, tariff=None, rng=None):
+    """
+    Draw the randomly shifted PV production and electricity prices of a simulated day.
+
+    Parameters:
+        weekday: Day of the week (0=Monday, ..., 6=Sunday).
+        period: Seasonal period (e.g., 'warm', 'cold').
+        seed: Random seed for reproducibility, used when no generator is given.
+        tariff: Optional prices per time slot, replacing the period's price slots.
+        rng: Optional numpy.random.Generator (e.g. from random_streams.make_rng) used for the draws.
+
+    Returns:
+        PV production per kW for each hour and electricity price for each hour.
+    """
+    if rng is None:
+        rng = make_rng(seed)
+    pv_profile = generate_solar_profile(period, n_panels=1, rng=rng)
+    price_slots_today = generate_price_slots(period, rng, tariff)
+    hourly_prices = {hour: price_slots_today[get_price_slot(hour, weekday)] for hour in range(24)}
+    return pv_profile, hourly_prices
+
+
 def add_ev_constraints(constraints_min, constraints_max, ev_charging_hours, ev_total_energy, ev_power_limit, max_kw):
     """
     Add EV charging constraints to the scheduling constraints.
@@ -75,7 +117,8 @@ def add_ev_constraints(constraints_min, constraints_max, ev_charging_hours, ev_t
     return constraints_min, constraints_max
 
 
-def simulation(weekday, scheduling, pv_panels_count, period, seed=0):
+def simulation(weekday, scheduling, pv_panels_count, period, seed=0, pv_profile=None, hourly_prices=None,
+               tariff=None, rng=None):
     """
     Simulate energy expenses and energy sold based on scheduling, solar generation, and electricity prices.
 
@@ -85,20 +128,27 @@ def simulation(weekday, scheduling, pv_panels_count, period, seed=0):
         pv_panels_count: Number of solar panels.
         period: Seasonal period (e.g., 'warm', 'cold').
         seed: Random seed for reproducibility.
+        pv_profile: Optional PV production per kW for each hour (e.g. a historical day), used as is
+            instead of a randomly shifted average profile.
+        hourly_prices: Optional electricity price for each hour (e.g. a historical day), used as is
+            instead of randomly shifted price slots.
+        tariff: Optional prices per time slot, replacing the period's price slots.
+        rng: Optional numpy.random.Generator used instead of the seed for the random draws.
 
     Returns:
         Total expenses, total energy sold, and hourly costs.
     """
-    np.random.seed(seed)
-
     tot_expenses = 0
     tot_energy_sold = 0
     hourly_costs = {}
     energy_discount = 0.05
 
     # Generate solar production and electricity price profiles
-    solar_profile = generate_solar_profile(period, n_panels=pv_panels_count)
-    price_slots_today = generate_price_slots(period)
+    if pv_profile is None or hourly_prices is None:
+        drawn_pv_profile, drawn_hourly_prices = draw_environment(weekday, period, seed, tariff, rng)
+        pv_profile = drawn_pv_profile if pv_profile is None else pv_profile
+        hourly_prices = drawn_hourly_prices if hourly_prices is None else hourly_prices
+    solar_profile = {hour: pv_panels_count * kwh for hour, kwh in pv_profile.items()}
 
     remaining_discounted_energy = 0
 
@@ -115,7 +165,7 @@ def simulation(weekday, scheduling, pv_panels_count, period, seed=0):
         remaining_discounted_energy -= discounted_energy
 
         # Calculate expenses for the hour
-        current_price = price_slots_today[get_price_slot(hour, weekday)]
+        current_price = hourly_prices[hour]
         discounted_price = current_price * energy_discount
         hour_expenses = discounted_price * discounted_energy + current_price * full_price_energy
         tot_expenses += hour_expenses
@@ -126,8 +176,48 @@ def simulation(weekday, scheduling, pv_panels_count, period, seed=0):
     return tot_expenses, tot_energy_sold, hourly_costs
 
 
+def simulation_batch(scheduling, solar_profile, hourly_prices, energy_discount=0.05):
+    """
+    Vectorized simulation: compute expenses for many schedules at once.
+
+    Every argument is an array of shape (households, 24), or broadcastable to it.
+
+    Parameters:
+        scheduling: Energy scheduling per hour of each household.
+        solar_profile: Solar energy generated per hour (already multiplied by the number of panels).
+        hourly_prices: Electricity price per hour.
+        energy_discount: Fraction of the price paid for energy covered by solar generation.
+
+    Returns:
+        Total expenses, total energy sold, and hourly costs of each household.
+    """
+    scheduling = np.asarray(scheduling, dtype=np.float64)
+    solar_profile, hourly_prices = np.broadcast_arrays(
+        np.asarray(solar_profile, dtype=np.float64), np.asarray(hourly_prices, dtype=np.float64)
+    )
+    shape = np.broadcast_shapes(scheduling.shape, solar_profile.shape)
+    hourly_costs = np.empty(shape)
+    remaining_discounted_energy = np.zeros(shape[:-1])
+
+    # Solar energy can be used in later hours, so hours are processed in order
+    for hour in range(24):
+        consumption = scheduling[..., hour]
+        remaining_discounted_energy = remaining_discounted_energy + solar_profile[..., hour]
+
+        discounted_energy = np.minimum(consumption, remaining_discounted_energy)
+        full_price_energy = np.maximum(0, consumption - discounted_energy)
+        remaining_discounted_energy = remaining_discounted_energy - discounted_energy
+
+        current_price = hourly_prices[..., hour]
+        hourly_costs[..., hour] = current_price * energy_discount * discounted_energy + current_price * full_price_energy
+
+    tot_energy_sold = np.broadcast_to(solar_profile.sum(axis=-1), shape[:-1])
+    return hourly_costs.sum(axis=-1), tot_energy_sold, hourly_costs
+
+
 def grid_search_params(weekday, period, tot_energy, pv_panels_count, constraints_min, constraints_max,
-                       hyperparameters_range, hyperparameters_test_count, max_kw, seed=0):
+                       hyperparameters_range, hyperparameters_test_count, max_kw, seed=0,
+                       pv_profile=None, hourly_prices=None, tariff=None, environment=None, screening=False):
     """
     Perform a grid search to find the optimal hyperparameters for scheduling.
 
@@ -142,6 +232,14 @@ def grid_search_params(weekday, period, tot_energy, pv_panels_count, constraints
         hyperparameters_test_count: Number of test points within the range.
         max_kw: Maximum energy allowed per hour.
         seed: Random seed for reproducibility.
+        pv_profile: Optional PV production per kW for each hour (e.g. a historical day).
+        hourly_prices: Optional electricity price for each hour (e.g. a historical day).
+        tariff: Optional prices per time slot, replacing the period's price slots.
+        environment: Optional (PV production per kW, hourly prices) pair used to simulate expenses,
+            as returned by draw_environment. By default it is drawn once from the seed.
+        screening: If True, every candidate is first scheduled in coarse mode, all at once on the batched
+            path, and only the candidates that can still be the best within their error bounds are
+            scheduled exactly. The result is the same as without screening.
 
     Returns:
         The best hyperparameters found during the search.
@@ -149,32 +247,68 @@ def grid_search_params(weekday, period, tot_energy, pv_panels_count, constraints
     best_expenses_score = np.inf
     best_hyperparameters = None
 
+    # The simulated day is the same for every candidate, so it is drawn only once
+    if environment is None:
+        environment = draw_environment(weekday, period, seed, tariff)
+    simulated_pv_profile = environment[0] if pv_profile is None else pv_profile
+    simulated_hourly_prices = environment[1] if hourly_prices is None else hourly_prices
+
+    def evaluate(hyperparameters):
+        scheduling = generate_scheduling(
+            weekday=weekday,
+            period=period,
+            tot_energy=tot_energy,
+            constraints_min=constraints_min,
+            constraints_max=constraints_max,
+            hyperparameters=hyperparameters,
+            max_kw=max_kw,
+            pv_profile=pv_profile,
+            hourly_prices=hourly_prices,
+            tariff=tariff
+        )
+        expenses, _, _ = simulation(
+            weekday=weekday,
+            scheduling=scheduling,
+            pv_panels_count=pv_panels_count,
+            period=period,
+            pv_profile=simulated_pv_profile,
+            hourly_prices=simulated_hourly_prices
+        )
+        return expenses
+
     hp_values = np.linspace(hyperparameters_range[0], hyperparameters_range[1], hyperparameters_test_count)
+    candidates = list(itertools.product(hp_values, repeat=4))
+
+    if screening:
+        # Coarse scheduling and expenses of every candidate in one batch
+        coarse_scheduling, error_bounds = generate_scheduling_batch(
+            tot_energy=np.full(len(candidates), float(tot_energy)),
+            constraints_min=hourly_to_array(constraints_min),
+            constraints_max=hourly_to_array(constraints_max),
+            price_scores=hourly_to_array(compute_price_scores(weekday, period, hourly_prices, tariff)),
+            pv_factors=hourly_to_array(compute_pv_factors(pv_profiles[period] if pv_profile is None else pv_profile)),
+            hp_factors=build_hp_factors_batch(candidates),
+            max_kw=max_kw,
+            coarse=True,
+            return_error_bounds=True
+        )
+        simulated_prices = hourly_to_array(simulated_hourly_prices)
+        coarse_expenses, _, _ = simulation_batch(
+            coarse_scheduling, pv_panels_count * hourly_to_array(simulated_pv_profile), simulated_prices
+        )
 
-    for hp_morning in hp_values:
-        for hp_afternoon in hp_values:
-            for hp_evening in hp_values:
-                for hp_night in hp_values:
-                    hyperparameters = Hyperparameters(hp_morning, hp_afternoon, hp_evening, hp_night)
-                    scheduling = generate_scheduling(
-                        weekday=weekday,
-                        period=period,
-                        tot_energy=tot_energy,
-                        constraints_min=constraints_min,
-                        constraints_max=constraints_max,
-                        hyperparameters=hyperparameters,
-                        max_kw=max_kw
-                    )
-                    expenses, _, _ = simulation(
-                        weekday=weekday,
-                        scheduling=scheduling,
-                        pv_panels_count=pv_panels_count,
-                        period=period,
-                        seed=seed
-                    )
-                    if expenses < best_expenses_score:
-                        best_expenses_score = expenses
-                        best_hyperparameters = hyperparameters
+        # Moving or adding one kWh changes the expenses by at most the highest hourly price. The exact
+        # scheduling is itself within EXACT_TOLERANCE of the converged one, hence the extra margin.
+        margin = (error_bounds['energy_error'] + 2 * EXACT_TOLERANCE) * simulated_prices.max()
+        finalists = coarse_expenses - margin <= (coarse_expenses + margin).min()
+        candidates = [values for values, finalist in zip(candidates, finalists) if finalist]
+
+    for values in candidates:
+        hyperparameters = Hyperparameters(*values)
+        expenses = evaluate(hyperparameters)
+        if expenses < best_expenses_score:
+            best_expenses_score = expenses
+            best_hyperparameters = hyperparameters
 
     return best_hyperparameters
 
@@ -273,6 +407,9 @@ def compare_scenarios(seed=0):
     """
     Compare scheduling and expenses across multiple scenarios (workdays/weekend, warm/cold season).
 
+    Parameters:
+        seed: Root random seed. Each scenario draws its simulated day from its own independent stream.
+
     Returns:
         List of results containing scheduling, costs, and hyperparameters for each scenario.
     """
@@ -292,6 +429,10 @@ def compare_scenarios(seed=0):
 
         print(f"Simulating for {day_type.capitalize()} in {season.capitalize()} season...")
 
+        # Draw the simulated day from the scenario's own random stream (the same one scenario_runner uses)
+        rng = make_rng(seed, scenario=scenario_stream(season, season, weekday))
+        pv_profile, hourly_prices = draw_environment(weekday, season, rng=rng)
+
         # Retrieve EV requirements for the current scenario
         ev_config = ev_requirements[day_type]
         ev_total_energy = ev_config["total_energy"]
@@ -307,7 +448,7 @@ def compare_scenarios(seed=0):
         )
 
         # Set total energy with a margin
-        tot_energy = 35 if day_type == "workdays" else 40
+        tot_energy = DEFAULT_ENERGY[day_type]
 
 
         # Generate initial scheduling with default hyperparameters
@@ -328,7 +469,8 @@ def compare_scenarios(seed=0):
             scheduling=initial_scheduling,
             pv_panels_count=5,
             period=season,
-            seed=seed
+            pv_profile=pv_profile,
+            hourly_prices=hourly_prices
         )
 
         # Perform grid search to find the best hyperparameters
@@ -342,7 +484,7 @@ def compare_scenarios(seed=0):
             hyperparameters_range=(0.1, 10),
             hyperparameters_test_count=5,
             max_kw=6,
-            seed=seed
+            environment=(pv_profile, hourly_prices)
         )
 
         # Generate optimized scheduling
@@ -362,7 +504,8 @@ def compare_scenarios(seed=0):
             scheduling=optimized_scheduling,
             pv_panels_count=5,
             period=season,
-            seed=seed
+            pv_profile=pv_profile,
+            hourly_prices=hourly_prices
         )
 
         # Store results for the scenario
@@ -401,6 +544,11 @@ def main():
     """
     results = compare_scenarios(seed=42)
 
+    # Store the results in columnar form for later analysis
+    compact_results = ScenarioResults.from_records(results)
+    compact_results.to_npz(os.path.join(output_path, 'scenario_results.npz'))
+    compact_results.to_csv(os.path.join(output_path, 'scenario_results.csv'))
+
     for result in results:
         print(f"Scenario: {result['scenario']}")
         print("Initial Expenses:", result["initial_expenses"])